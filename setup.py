@@ -19,7 +19,6 @@ setup(
     python_requires=">=3",
     install_requires=[
         "typing_extensions",
-        "mrcrowbar >= 1.0.0rc2",
         "iced_x86 >= 1.21.0",
     ],
     extras_require={},
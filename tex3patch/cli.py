@@ -1,6 +1,7 @@
 from __future__ import annotations
 
 import argparse
+import logging
 import pathlib
 import sys
 
@@ -29,6 +30,12 @@ def main(argv: list[str] | None = None) -> None:
     parser.add_argument(
         "--invert-y", action="store_true", help="Invert Y-axis movement for mouselook."
     )
+    parser.add_argument(
+        "--verbose",
+        "-v",
+        action="store_true",
+        help="Print the offsets found and the fixups changed while patching.",
+    )
     parser.add_argument(
         "--version",
         "-V",
@@ -37,6 +44,11 @@ def main(argv: list[str] | None = None) -> None:
         help="Show program's version number and exit.",
     )
     args = parser.parse_args(argv or sys.argv[1:])
+    logging.basicConfig(format="%(message)s")
+    # only our own loggers, libraries can be very chatty at debug level
+    logging.getLogger(__package__).setLevel(
+        logging.DEBUG if args.verbose else logging.INFO
+    )
     patch(args.INPUT, args.OUTPUT, args.fix_speed, args.mouselook, args.invert_y)
 
 
@@ -1,111 +1,171 @@
 from __future__ import annotations
 
+import logging
+import struct
+from dataclasses import astuple, dataclass
 from typing import NamedTuple
 
-from mrcrowbar import models as mrc
-from mrcrowbar import utils
-
-
-class LEHeader(mrc.Block):
-    magic = mrc.Const(mrc.Bytes(length=2), b"LE")
-    b_ord = mrc.UInt8()
-    w_ord = mrc.UInt8()
-    format_level = mrc.UInt32_LE()
-    cpu_type = mrc.UInt16_LE()
-    os_type = mrc.UInt16_LE()
-    module_version = mrc.UInt32_LE()
-    module_flags = mrc.UInt32_LE()
-    module_num_pages = mrc.UInt32_LE()
-    eip_obj_num = mrc.UInt32_LE()
-    eip = mrc.UInt32_LE()
-    esp_obj_num = mrc.UInt32_LE()
-    esp = mrc.UInt32_LE()
-    page_size = mrc.UInt32_LE()
-    page_offset_shift = mrc.UInt32_LE()
-    fixup_section_size = mrc.UInt32_LE()
-    fixup_section_csum = mrc.UInt32_LE()
-    loader_section_size = mrc.UInt32_LE()
-    loader_section_csum = mrc.UInt32_LE()
-    obj_table_offset = mrc.UInt32_LE()
-    obj_count = mrc.UInt32_LE()
-    obj_page_table_offset = mrc.UInt32_LE()
-    obj_iter_pages_offset = mrc.UInt32_LE()
-    res_table_offset = mrc.UInt32_LE()
-    res_count = mrc.UInt32_LE()
-    resident_name_table_offset = mrc.UInt32_LE()
-    entry_table_offset = mrc.UInt32_LE()
-    module_directives_offset = mrc.UInt32_LE()
-    module_directives_count = mrc.UInt32_LE()
-    fixup_page_table_offset = mrc.UInt32_LE()
-    fixup_record_table_offset = mrc.UInt32_LE()
-    import_module_table_offset = mrc.UInt32_LE()
-    import_module_count = mrc.UInt32_LE()
-    import_proc_table_offset = mrc.UInt32_LE()
-    per_page_csum_offset = mrc.UInt32_LE()
-    data_pages_offset = mrc.UInt32_LE()
-    preload_pages_count = mrc.UInt32_LE()
-    nonres_name_table_offset = mrc.UInt32_LE()
-    nonres_name_table_length = mrc.UInt32_LE()
-    nonres_name_table_csum = mrc.UInt32_LE()
-    auto_ds_object_count = mrc.UInt32_LE()
-    debug_info_offset = mrc.UInt32_LE()
-    debug_info_length = mrc.UInt32_LE()
-    instance_preload_count = mrc.UInt32_LE()
-    instance_demand_count = mrc.UInt32_LE()
-    heap_size = mrc.UInt32_LE()
-    stack_size = mrc.UInt32_LE()
-
-
-class FixupPageTable(mrc.Block):
-    offsets = mrc.UInt32_LE(stream=True)
-
-
-class ObjectTableEntry(mrc.Block):
-    virtual_size = mrc.UInt32_LE()
-    reloc_base_addr = mrc.UInt32_LE()
-    object_flags = mrc.UInt16_LE()
-    unused1 = mrc.UInt16_LE()
-    page_table_index = mrc.UInt32_LE()
-    page_table_entries = mrc.UInt32_LE()
-    unused2 = mrc.UInt32_LE()
-
-
-class ObjectTable(mrc.Block):
-    entries = mrc.BlockField(ObjectTableEntry, stream=True)
+logger = logging.getLogger(__name__)
+
+# LE header layout, in the same order as the fields of LEHeader
+_LE_HEADER = struct.Struct("<2sBBIHH" + "I" * 41)
+
+
+@dataclass(slots=True)
+class LEHeader:
+    magic: bytes
+    b_ord: int
+    w_ord: int
+    format_level: int
+    cpu_type: int
+    os_type: int
+    module_version: int
+    module_flags: int
+    module_num_pages: int
+    eip_obj_num: int
+    eip: int
+    esp_obj_num: int
+    esp: int
+    page_size: int
+    page_offset_shift: int
+    fixup_section_size: int
+    fixup_section_csum: int
+    loader_section_size: int
+    loader_section_csum: int
+    obj_table_offset: int
+    obj_count: int
+    obj_page_table_offset: int
+    obj_iter_pages_offset: int
+    res_table_offset: int
+    res_count: int
+    resident_name_table_offset: int
+    entry_table_offset: int
+    module_directives_offset: int
+    module_directives_count: int
+    fixup_page_table_offset: int
+    fixup_record_table_offset: int
+    import_module_table_offset: int
+    import_module_count: int
+    import_proc_table_offset: int
+    per_page_csum_offset: int
+    data_pages_offset: int
+    preload_pages_count: int
+    nonres_name_table_offset: int
+    nonres_name_table_length: int
+    nonres_name_table_csum: int
+    auto_ds_object_count: int
+    debug_info_offset: int
+    debug_info_length: int
+    instance_preload_count: int
+    instance_demand_count: int
+    heap_size: int
+    stack_size: int
+
+    @classmethod
+    def unpack_from(cls, buffer: bytes, offset: int = 0) -> LEHeader:
+        header = cls(*_LE_HEADER.unpack_from(buffer, offset))
+        if header.magic != b"LE":
+            raise RuntimeError(f"Expected LE header, found {header.magic}")
+        return header
+
+    def export_data(self) -> bytes:
+        return _LE_HEADER.pack(*astuple(self))
+
+    def get_size(self) -> int:
+        return _LE_HEADER.size
+
+
+@dataclass(slots=True)
+class FixupPageTable:
+    offsets: list[int]
+
+    @classmethod
+    def unpack_from(cls, buffer: bytes, offset: int, count: int) -> FixupPageTable:
+        return cls(list(struct.unpack_from(f"<{count}I", buffer, offset)))
+
+    def export_data(self) -> bytes:
+        return struct.pack(f"<{len(self.offsets)}I", *self.offsets)
+
+
+_OBJECT_TABLE_ENTRY = struct.Struct("<IIHHIII")
+
+# object_flags bit for objects containing code
+OBJECT_EXECUTABLE = 0x0004
+
+
+@dataclass(slots=True)
+class ObjectTableEntry:
+    virtual_size: int
+    reloc_base_addr: int
+    object_flags: int
+    unused1: int
+    page_table_index: int
+    page_table_entries: int
+    unused2: int
+
+
+@dataclass(slots=True)
+class ObjectTable:
+    entries: list[ObjectTableEntry]
+
+    @classmethod
+    def unpack_from(cls, buffer: bytes, offset: int, count: int) -> ObjectTable:
+        end = offset + count * _OBJECT_TABLE_ENTRY.size
+        return cls(
+            [
+                ObjectTableEntry(*entry)
+                for entry in _OBJECT_TABLE_ENTRY.iter_unpack(buffer[offset:end])
+            ]
+        )
+
+
+_OBJECT_PAGE_TABLE_ENTRY = struct.Struct("<HH")
 
 
 # this looks very different to the definition in the IBM document
 # doesn't matter, this is what DOS/32A does
-class ObjectPageTableEntry(mrc.Block):
-    unk = mrc.UInt16_LE()
-    value = mrc.UInt16_LE()
+@dataclass(slots=True)
+class ObjectPageTableEntry:
+    unk: int
+    value: int
 
 
-class ObjectPageTable(mrc.Block):
-    entries = mrc.BlockField(ObjectPageTableEntry, stream=True)
+@dataclass(slots=True)
+class ObjectPageTable:
+    entries: list[ObjectPageTableEntry]
+
+    @classmethod
+    def unpack_from(cls, buffer: bytes, offset: int, count: int) -> ObjectPageTable:
+        end = offset + count * _OBJECT_PAGE_TABLE_ENTRY.size
+        return cls(
+            [
+                ObjectPageTableEntry(*entry)
+                for entry in _OBJECT_PAGE_TABLE_ENTRY.iter_unpack(buffer[offset:end])
+            ]
+        )
+
+
+# MZ/BW header: magic, last_page_bytes, page_count, relocation_table_offset, code32_start
+_MZ_HEADER = struct.Struct("<2sHH18xH34xH")
 
 
 def search_for_le(exe: bytes) -> tuple[int, int]:
     ptr = 0
-    result = []
-    while ptr < len(exe):
-        header = exe[ptr : ptr + 64]
-        if header[0:2] in (b"MZ", b"BW"):
-            relocation_table_offset = utils.from_uint16_le(header[0x18:0x1A])
+    while ptr + _MZ_HEADER.size <= len(exe):
+        magic, last_page_bytes, page_count, relocation_table_offset, code32_start = (
+            _MZ_HEADER.unpack_from(exe, ptr)
+        )
+        if magic in (b"MZ", b"BW"):
             if relocation_table_offset == 0x40:
-                code32_start = utils.from_uint16_le(header[0x3C:0x3E])
                 if code32_start != 0:
-                    print("Found LE inside!")
+                    logger.debug("Found LE inside MZ header at 0x%08x", ptr)
                     return (ptr, ptr + code32_start)
-            page_count = utils.from_uint16_le(header[0x4:0x6])
-            last_page_bytes = utils.from_uint16_le(header[0x2:0x4])
             total_size = (page_count << 9) + last_page_bytes
-            if header[0:2] == b"MZ":
+            if magic == b"MZ":
                 total_size -= 0x200
-            result.append((header[0:2], exe[ptr : ptr + total_size]))
             ptr += total_size
         else:
-            raise RuntimeError(f"I give up {header[0:2]}")
+            raise RuntimeError(f"I give up {magic}")
 
     raise RuntimeError("Couldn't find LE!")
 
@@ -119,75 +179,74 @@ class FixupTuple(NamedTuple):
     data: int | None
 
 
+# fixup record header: src, flags, srcoff, objnum
+_HDR = struct.Struct("<BBHB")
+_U16 = struct.Struct("<H")
+_U32 = struct.Struct("<I")
+
+# (src, 32-bit target flag) -> (fixup type, payload size)
+_FIXUP_TYPES: dict[tuple[int, bool], tuple[str, int]] = {
+    (0x7, True): ("fix_32off_32", 4),
+    (0x7, False): ("fix_32off_16", 2),
+    (0x5, True): ("fix_16off_32", 4),
+    (0x5, False): ("fix_16off_16", 2),
+    (0x6, True): ("fix_1632ptr_32", 4),
+    (0x6, False): ("fix_1632ptr_16", 2),
+    (0x2, True): ("fix_16sel", 0),
+    (0x2, False): ("fix_16sel", 0),
+}
+_FIXUP_PAYLOAD_SIZES: dict[str, int] = dict(_FIXUP_TYPES.values())
+# fixup type -> struct for the whole record, header plus payload
+_FIXUP_RECORDS: dict[str, struct.Struct] = {
+    id: struct.Struct(_HDR.format + {0: "", 2: "H", 4: "I"}[payload_size])
+    for id, payload_size in _FIXUP_PAYLOAD_SIZES.items()
+}
+
+
 def fixups_encode(fixups: list[FixupTuple]) -> bytes:
-    buffer = bytearray()
+    # size the output up front so records can be packed in place
+    records = _FIXUP_RECORDS
+    size = 0
+    for fixup in fixups:
+        record = records.get(fixup.id)
+        if record is None:
+            raise RuntimeError(f"failed to encode fixup type {fixup.id}!")
+        size += record.size
+
+    buffer = bytearray(size)
+    fix_ptr = 0
     for id, src, flags, objnum, srcoff, fix_data in fixups:
-        buffer.append(src)
-        buffer.append(flags)
-        buffer.extend(utils.to_uint16_le(srcoff))
-        buffer.append(objnum + 1)
-        if id in ("fix_32off_16", "fix_16off_16", "fix_1632ptr_16"):
-            buffer.extend(utils.to_uint16_le(fix_data))
-        elif id in ("fix_32off_32", "fix_16off_32", "fix_1632ptr_32"):
-            buffer.extend(utils.to_uint32_le(fix_data))
-        elif id == "fix_16sel":
-            pass
+        record = records[id]
+        if fix_data is None:
+            record.pack_into(buffer, fix_ptr, src, flags, srcoff, objnum + 1)
         else:
-            raise RuntimeError(f"failed to encode fixup type {id}!")
+            record.pack_into(buffer, fix_ptr, src, flags, srcoff, objnum + 1, fix_data)
+        fix_ptr += record.size
     return bytes(buffer)
 
 
 def fixups_decode(buffer: bytes) -> list[FixupTuple]:
+    # hot loop; keep lookups local
+    unpack_hdr = _HDR.unpack_from
+    unpack_u16 = _U16.unpack_from
+    unpack_u32 = _U32.unpack_from
+    fixup_types = _FIXUP_TYPES
     fix_ptr = 0
+    end = len(buffer)
     items: list[FixupTuple] = []
-    while fix_ptr < len(buffer):
-        ptr_start = fix_ptr
-        src = buffer[fix_ptr]
-        flags = buffer[fix_ptr + 1]
-        srcoff = utils.from_uint16_le(buffer[fix_ptr + 2 : fix_ptr + 4])
-        objnum = buffer[fix_ptr + 4] - 1
+    append = items.append
+    while fix_ptr < end:
+        src, flags, srcoff, objnum = unpack_hdr(buffer, fix_ptr)
+        fixup_type = fixup_types.get((src, (flags & 0x10) != 0))
+        if fixup_type is None:
+            raise RuntimeError(f"failed to decode at 0x{fix_ptr:08x}! {src} {flags}")
+        id, payload_size = fixup_type
         fix_ptr += 5
-        if src == 0x7:
-            if flags & 0x10:
-                fix_data = utils.from_uint32_le(buffer[fix_ptr : fix_ptr + 4])
-                fix_ptr += 4
-                items.append(
-                    FixupTuple("fix_32off_32", src, flags, objnum, srcoff, fix_data)
-                )
-            else:
-                fix_data = utils.from_uint16_le(buffer[fix_ptr : fix_ptr + 2])
-                fix_ptr += 2
-                items.append(
-                    FixupTuple("fix_32off_16", src, flags, objnum, srcoff, fix_data)
-                )
-        elif src == 0x5:
-            if flags & 0x10:
-                fix_data = utils.from_uint32_le(buffer[fix_ptr : fix_ptr + 4])
-                fix_ptr += 4
-                items.append(
-                    FixupTuple("fix_16off_32", src, flags, objnum, srcoff, fix_data)
-                )
-            else:
-                fix_data = utils.from_uint16_le(buffer[fix_ptr : fix_ptr + 2])
-                fix_ptr += 2
-                items.append(
-                    FixupTuple("fix_16off_16", src, flags, objnum, srcoff, fix_data)
-                )
-        elif src == 0x6:
-            if flags & 0x10:
-                fix_data = utils.from_uint32_le(buffer[fix_ptr : fix_ptr + 4])
-                fix_ptr += 4
-                items.append(
-                    FixupTuple("fix_1632ptr_32", src, flags, objnum, srcoff, fix_data)
-                )
-            else:
-                fix_data = utils.from_uint16_le(buffer[fix_ptr : fix_ptr + 2])
-                fix_ptr += 2
-                items.append(
-                    FixupTuple("fix_1632ptr_16", src, flags, objnum, srcoff, fix_data)
-                )
-        elif src == 0x2:
-            items.append(FixupTuple("fix_16sel", src, flags, objnum, srcoff, None))
-        else:
-            raise RuntimeError(f"failed to decode at 0x{ptr_start:08x}! {src} {flags}")
+        fix_data = None
+        if payload_size == 4:
+            fix_data = unpack_u32(buffer, fix_ptr)[0]
+        elif payload_size == 2:
+            fix_data = unpack_u16(buffer, fix_ptr)[0]
+        fix_ptr += payload_size
+        append(FixupTuple(id, src, flags, objnum - 1, srcoff, fix_data))
     return items
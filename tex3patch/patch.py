@@ -1,19 +1,24 @@
 #!/usr/bin/env python3
 
+import logging
+import mmap
 import pathlib
+import re
+import struct
+from bisect import bisect_right
+from itertools import accumulate, chain
 
 from iced_x86 import (
     BlockEncoder,
     Code,
     Decoder,
     Instruction,
-    InstructionInfoFactory,
     MemoryOperand,
     Register,
 )
-from mrcrowbar import utils
 
 from .le import (
+    OBJECT_EXECUTABLE,
     FixupPageTable,
     FixupTuple,
     LEHeader,
@@ -24,6 +29,11 @@ from .le import (
     search_for_le,
 )
 
+logger = logging.getLogger(__name__)
+
+_I32 = struct.Struct("<i")
+_U32 = struct.Struct("<I")
+
 label_id: int = 1
 
 
@@ -52,28 +62,71 @@ def assemble_x86(data: list[Instruction]) -> bytes:
     return result
 
 
+# pure NOP sleds don't need the encoder, just repeat this
+NOP_BYTES = assemble_x86([Instruction.create(Code.NOPD)])
+
+
 class DataNotFound(Exception):
     pass
 
 
-def detect_version(page_data: bytearray) -> tuple[str, str, str]:
-    # Scrape title + version number from the command line version screen
-    VERSION_PATTERN = "\\xda\\xc4+\\xbf(?:\\x0a\\x0d|\\x0d\\x0a)\\xb3\\x20+([A-Za-z ]+)\\x20+\\xb3(?:\\x0a\\x0d|\\x0d\\x0a)\\xb3\\x20+Version ([0-9\\.a-zA-Z]+)\\x20+\\xb3"
-    result = utils.grep(VERSION_PATTERN, page_data)
+CODE_OBJ = 0
+DATA_OBJ = 2
+
+# Instructions which reference an absolute address, mapped to the object it points into.
+# this is incomplete, there's hundreds of instructions in x86 which access memory.
+# I'm just adding them when I need them
+FIXUP_INSTRUCTIONS: dict[int, int] = {
+    Code.ADD_RM32_R32: DATA_OBJ,
+    Code.MOV_RM32_IMM32: DATA_OBJ,
+    Code.AND_R8_RM8: DATA_OBJ,
+    Code.TEST_RM8_IMM8: DATA_OBJ,
+    Code.CMP_R32_RM32: DATA_OBJ,
+    Code.CMP_RM8_IMM8: DATA_OBJ,
+    Code.MOV_R8_RM8: DATA_OBJ,
+    Code.MOV_R32_RM32: DATA_OBJ,
+    Code.ADD_R32_RM32: DATA_OBJ,
+    Code.AND_RM8_IMM8: DATA_OBJ,
+    Code.MOV_RM32_R32: DATA_OBJ,
+    Code.SUB_RM32_R32: DATA_OBJ,
+    Code.SUB_R32_RM32: DATA_OBJ,
+    Code.MOV_AL_MOFFS8: DATA_OBJ,
+    Code.MOV_MOFFS32_EAX: DATA_OBJ,
+    Code.MOV_EAX_MOFFS32: DATA_OBJ,
+    Code.MOV_RM16_IMM16: DATA_OBJ,
+    Code.JMP_RM32: CODE_OBJ,
+}
+
+# Instructions from the above which only need a fixup in their memory operand form
+MEMORY_OR_REGISTER = frozenset(
+    {Code.MOV_RM32_R32, Code.SUB_RM32_R32, Code.SUB_R32_RM32}
+)
+
+
+# Scrape title + version number from the command line version screen
+VERSION_PATTERN = re.compile(
+    rb"\xda\xc4+\xbf(?:\x0a\x0d|\x0d\x0a)\xb3\x20+([A-Za-z ]+)\x20+\xb3(?:\x0a\x0d|\x0d\x0a)\xb3\x20+Version ([0-9\.a-zA-Z]+)\x20+\xb3",
+    re.DOTALL,
+)
+
+# Apparently there's one debug message which has the language in it
+LANGUAGE_PATTERN = re.compile(
+    rb"\x00([A-Za-z]+)\x00Retrieving DIGI settings", re.DOTALL
+)
+
+
+def detect_version(page_data: memoryview) -> tuple[str, str, str]:
+    result = VERSION_PATTERN.search(page_data)
     if not result:
         raise DataNotFound(
             "Failed to detect Under a Killing Moon or The Pandora Directive! Please create an issue on https://github.com/moralrecordings/tex3-mouselook"
         )
-    game, version = result[0].group(1).decode("ascii"), result[0].group(2).decode(
-        "ascii"
-    )
+    game, version = result.group(1).decode("ascii"), result.group(2).decode("ascii")
 
-    # Apparently there's one debug message which has the language in it
-    LANGUAGE_PATTERN = "\\x00([A-Za-z]+)\\x00Retrieving DIGI settings"
-    result = utils.grep(LANGUAGE_PATTERN, page_data)
+    result = LANGUAGE_PATTERN.search(page_data)
     language = "UNKNOWN"
     if result:
-        language = result[0].group(1).decode("ascii")
+        language = result.group(1).decode("ascii")
 
     if game not in ("Under a Killing Moon", "The Pandora Directive"):
         raise DataNotFound(
@@ -84,35 +137,55 @@ def detect_version(page_data: bytearray) -> tuple[str, str, str]:
     return game, version, language
 
 
-def find_offset(
-    page_data: bytearray, pattern: str, offset: int, description: str
-) -> int:
+def find_unique(
+    page_data: memoryview,
+    pattern: bytes,
+    kind: str,
+    description: str,
+    search_ranges: list[tuple[int, int]] | None = None,
+) -> re.Match[bytes]:
     if not pattern:
         raise DataNotFound(f"No pattern for {description}, aborting")
-    matches = utils.grep(pattern, page_data)
-    if not matches:
-        raise DataNotFound(f"Could not find offset for {description}, aborting")
-    if len(matches) > 1:
+    regex = re.compile(pattern, re.DOTALL)
+    # a unique match only needs the scan to run once past it, but has to be
+    # unique across all of the ranges
+    matches = chain.from_iterable(
+        regex.finditer(page_data, pos, endpos)
+        for pos, endpos in search_ranges or [(0, len(page_data))]
+    )
+    match = next(matches, None)
+    if match is None:
+        raise DataNotFound(f"Could not find {kind} for {description}, aborting")
+    extra = next(matches, None)
+    if extra is not None:
         raise DataNotFound(
-            f"Multiple offset matches found for {description} ({matches}), aborting"
+            f"Multiple {kind} matches found for {description} ({[match, extra, *matches]}), aborting"
         )
-    result = matches[0].start() + offset
-    print(f"Offset for {description} found at 0x{result:08x}")
+    return match
+
+
+def find_offset(
+    page_data: memoryview,
+    pattern: bytes,
+    offset: int,
+    description: str,
+    search_ranges: list[tuple[int, int]] | None = None,
+) -> int:
+    match = find_unique(page_data, pattern, "offset", description, search_ranges)
+    result = match.start() + offset
+    logger.debug("Offset for %s found at 0x%08x", description, result)
     return result
 
 
-def find_variable(page_data: bytearray, pattern: str, description: str) -> int:
-    if not pattern:
-        raise DataNotFound(f"No pattern for {description}, aborting")
-    matches = utils.grep(pattern, page_data)
-    if not matches:
-        raise DataNotFound(f"Could not find variable for {description}, aborting")
-    if len(matches) > 1:
-        raise DataNotFound(
-            f"Multiple variable matches found for {description} ({matches}), aborting"
-        )
-    result = utils.from_uint32_le(matches[0].group(1))
-    print(f"Variable for {description} found at 0x{result:08x}")
+def find_variable(
+    page_data: memoryview,
+    pattern: bytes,
+    description: str,
+    search_ranges: list[tuple[int, int]] | None = None,
+) -> int:
+    match = find_unique(page_data, pattern, "variable", description, search_ranges)
+    result = _U32.unpack_from(page_data, match.start(1))[0]
+    logger.debug("Variable for %s found at 0x%08x", description, result)
     return result
 
 
@@ -123,43 +196,69 @@ def patch(
     mouselook: bool,
     invert_y: bool,
 ) -> None:
-    f = open(input, "rb").read()
+    with open(input, "rb") as fh:
+        # map the executable instead of reading it all in. the exception is
+        # patching in place, as truncating the output would pull the mapped
+        # pages out from under us. pipes and empty files can't be mapped, so
+        # read those in as well.
+        f: bytes | mmap.mmap
+        if output.exists() and output.samefile(input):
+            f = fh.read()
+        else:
+            try:
+                f = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+            except (OSError, ValueError):
+                f = fh.read()
+    # slice the file through a view, so we're not copying it every time
+    fv = memoryview(f)
     # read the LE header from the executable
-    mz_off, le_off = search_for_le(f)
-    le_header = LEHeader(f[le_off:])
+    mz_off, le_off = search_for_le(fv)
+    le_header = LEHeader.unpack_from(fv, le_off)
+    # LE page sizes are a power of two, so page maths can use shifts and masks
+    page_size = le_header.page_size
+    if page_size <= 0 or page_size & (page_size - 1):
+        raise RuntimeError(f"Unsupported LE page size {page_size}")
+    page_shift = page_size.bit_length() - 1
+    page_mask = page_size - 1
 
     # loader_section, fixup_section, data_section, debug_section
 
     # extract the various fixup tables used to hotpatch addresses.
     # for any areas of code we patch, we will have to remove the old fixups and sub in new ones.
-    fixup_page_table = FixupPageTable(
-        f[le_off + le_header.fixup_page_table_offset :][
-            : 4 * (le_header.module_num_pages + 1)
-        ]
+    fixup_page_table = FixupPageTable.unpack_from(
+        fv,
+        le_off + le_header.fixup_page_table_offset,
+        le_header.module_num_pages + 1,
     )
-    fixup_record_table = []
-    for i in range(le_header.module_num_pages):
-        fixup_record_table.append(
-            f[le_off + le_header.fixup_record_table_offset :][
-                fixup_page_table.offsets[i] : fixup_page_table.offsets[i + 1]
-            ]
-        )
-
-    fixup_records = [fixups_decode(x) for x in fixup_record_table]
-    object_table = ObjectTable(
-        f[le_off + le_header.obj_table_offset :][: le_header.obj_count * 0x18]
+    fixup_record_table_start = le_off + le_header.fixup_record_table_offset
+    fixup_page_offsets = fixup_page_table.offsets
+    fixup_record_table = [
+        fv[fixup_record_table_start + start : fixup_record_table_start + end]
+        for start, end in zip(fixup_page_offsets, fixup_page_offsets[1:])
+    ]
+
+    # fixups are only decoded for pages touched by a code patch, the rest are
+    # written back out verbatim
+    fixup_records: dict[int, list[FixupTuple]] = {}
+    object_table = ObjectTable.unpack_from(
+        fv, le_off + le_header.obj_table_offset, le_header.obj_count
     )
-    object_page_table = ObjectPageTable(
-        f[le_off + le_header.obj_page_table_offset :][
-            : le_header.module_num_pages * 0x4
-        ]
+    object_page_table = ObjectPageTable.unpack_from(
+        fv, le_off + le_header.obj_page_table_offset, le_header.module_num_pages
     )
 
     # extract the code and data segments
-    page_data_orig = f[mz_off + le_header.data_pages_offset :]
-    page_data = bytearray(page_data_orig)
+    page_data = fv[mz_off + le_header.data_pages_offset :]
 
-    iff = InstructionInfoFactory()
+    # all of our signatures are for code, so only search the executable objects
+    code_ranges = [
+        (
+            (entry.page_table_index - 1) << page_shift,
+            (entry.page_table_index - 1 + entry.page_table_entries) << page_shift,
+        )
+        for entry in object_table.entries
+        if entry.object_flags & OBJECT_EXECUTABLE
+    ] or None
 
     # scrape version information
     name, version, language = detect_version(page_data)
@@ -180,11 +279,12 @@ def patch(
         """
         fix_speed_offset = find_offset(
             page_data,
-            "\\xf7\\xd8\\x83\\xc0\\x64\\x75\\x05\\xb8\\x04\\x00\\x00\\x00",
+            rb"\xf7\xd8\x83\xc0\x64\x75\x05\xb8\x04\x00\x00\x00",
             5,
             "speed bug code",
+            code_ranges,
         )
-        fix_speed_code = assemble_x86([Instruction.create(Code.NOPD)] * 7)
+        fix_speed_code = NOP_BYTES * 7
         CODE_PATCHES.append((fix_speed_code, fix_speed_offset))
 
     if mouselook:
@@ -194,63 +294,78 @@ def patch(
         # the same across versions; use that as a basis.
         var_movement_rot_angle = find_variable(
             page_data,
-            "\\xa3(.{4})\\xc1\\xf8\\x10\\xe8.{4}\\xa1.{4}",
+            rb"\xa3(.{4})\xc1\xf8\x10\xe8.{4}\xa1.{4}",
             "head rotation angle",
+            code_ranges,
         )
         var_movement_tilt_angle = find_variable(
-            page_data, "\\xc7\\x05(.{4})\\x2c\\x01\\x00\\x00", "head tilt angle"
+            page_data,
+            rb"\xc7\x05(.{4})\x2c\x01\x00\x00",
+            "head tilt angle",
+            code_ranges,
         )
         var_movement_tilt_angle_last = find_variable(
             page_data,
-            "\\xa3(.{4})\\xa1.{4}\\x0b\\xc0\\x74\\x2c",
+            rb"\xa3(.{4})\xa1.{4}\x0b\xc0\x74\x2c",
             "last head tilt angle",
+            code_ranges,
         )
         var_movement_tilt_angle_bottom = find_variable(
             page_data,
-            "\\xa1(.{4})\\xa3.{4}\\xa3.{4}\\x0f\\xb6\\x1d.{4}",
+            rb"\xa1(.{4})\xa3.{4}\xa3.{4}\x0f\xb6\x1d.{4}",
             "min head tilt angle",
+            code_ranges,
         )
         var_movement_tilt_angle_top = find_variable(
             page_data,
-            "\\xa1(.{4})\\xa3.{4}\\xa3.{4}\\xa1.{4}\\x0b\\xc0",
+            rb"\xa1(.{4})\xa3.{4}\xa3.{4}\xa1.{4}\x0b\xc0",
             "max head tilt angle",
+            code_ranges,
         )
         var_movement_strafe = find_variable(
-            page_data, "\\x83\\x25(.{4})\\xfc\\x66\\x0f.{4}", "strafe flag"
+            page_data, rb"\x83\x25(.{4})\xfc\x66\x0f.{4}", "strafe flag", code_ranges
         )
         var_keyboard_state = find_variable(
-            page_data, "\\xb9\\x2c\\x00\\x00\\x00\\xbf(.{4})", "keyboard state array"
+            page_data,
+            rb"\xb9\x2c\x00\x00\x00\xbf(.{4})",
+            "keyboard state array",
+            code_ranges,
         )
         var_movement_fwd_veloc_world = find_variable(
             page_data,
-            "\\xf7\\x2d.{4}\\x0f\\xac\\xd0\\x10\\xa3(.{4})\\x8b\\xc1",
+            rb"\xf7\x2d.{4}\x0f\xac\xd0\x10\xa3(.{4})\x8b\xc1",
             "forward velocity",
+            code_ranges,
         )
         var_movement_strafe_veloc_world = find_variable(
             page_data,
-            "\\x0b\\xed\\x79\\x02\\xf7\\xd8\\xa3(.{4})\\xc3",
+            rb"\x0b\xed\x79\x02\xf7\xd8\xa3(.{4})\xc3",
             "strafe velocity",
+            code_ranges,
         )
         var_movement_eye_level_incr = find_variable(
             page_data,
-            "\\x80\\xa0.{4}\\x01\\x80\\xa3.{4}\\x01\\xa1(.{4})",
+            rb"\x80\xa0.{4}\x01\x80\xa3.{4}\x01\xa1(.{4})",
             "eye level increment",
+            code_ranges,
         )
         var_movement_eye_level = find_variable(
             page_data,
-            "\\x80\\xa0.{4}\\x01\\x80\\xa3.{4}\\x01\\xa1.{4}\\x29\\x05(.{4})",
+            rb"\x80\xa0.{4}\x01\x80\xa3.{4}\x01\xa1.{4}\x29\x05(.{4})",
             "eye level",
+            code_ranges,
         )
         var_movement_eye_level_max = find_variable(
-            page_data, "\\xc1\\xe1\\x0c\\x03\\xc1\\xa3(.{4})", "max eye level"
+            page_data, rb"\xc1\xe1\x0c\x03\xc1\xa3(.{4})", "max eye level", code_ranges
         )
         var_movement_eye_level_min = find_variable(
             page_data,
-            "\\x83\\xf8\\x00\\x74\\x1f\\xe8.{4}\\x2b\\x05(.{4})",
+            rb"\x83\xf8\x00\x74\x1f\xe8.{4}\x2b\x05(.{4})",
             "min eye level",
+            code_ranges,
         )
         var_movement_eye_level_restore = find_variable(
-            page_data, "\\x2b\\xd0\\x89\\x15(.{4})", "default eye level"
+            page_data, rb"\x2b\xd0\x89\x15(.{4})", "default eye level", code_ranges
         )
 
         var_using_alien_abductor = None
@@ -262,33 +377,39 @@ def patch(
         if name == "The Pandora Directive":
             var_using_alien_abductor = find_variable(
                 page_data,
-                "\\x88\\x45\\xfc\\xf6\\x45\\xfc\\x02\\x75\\x05\\xe8.{4}\\xe8.{4}\\xc6\\x05(.{4})\\x01",
+                rb"\x88\x45\xfc\xf6\x45\xfc\x02\x75\x05\xe8.{4}\xe8.{4}\xc6\x05(.{4})\x01",
                 "Alien Abductor flag",
+                code_ranges,
             )
             var_abductor_state = find_variable(
                 page_data,
-                "\\x8b\\x45\\xf0\\x80\\x88.{4}\\x02\\x80\\x3d(.{4})\\x02",
+                rb"\x8b\x45\xf0\x80\x88.{4}\x02\x80\x3d(.{4})\x02",
                 "Alien Abductor state",
+                code_ranges,
             )
             var_abductor_dpad = find_variable(
                 page_data,
-                "\\xf7\\xd8\\x89\\x45\\xf8\\xf6\\x05(.{4})\\x04",
+                rb"\xf7\xd8\x89\x45\xf8\xf6\x05(.{4})\x04",
                 "Alien Abductor directional pad state",
+                code_ranges,
             )
             var_fake_key_input = find_variable(
                 page_data,
-                "\\xc7\\x45\\xf4\\x00\\x00\\x00\\x00\\xc7\\x45\\xfc(.{4})\\x8b\\x45\\xfc",
+                rb"\xc7\x45\xf4\x00\x00\x00\x00\xc7\x45\xfc(.{4})\x8b\x45\xfc",
                 "Alien Abductor key input buffer",
+                code_ranges,
             )
             var_mouse_unbounded_x_mod = find_variable(
                 page_data,
-                "\\xe9\\x1f\\x02\\x00\\x00\\xc7\\x45\\xfc\\x0c\\x00\\x00\\x00\\x66\\xc7\\x05(.{4})\\x00\\x00\\x66\\xc7\\x05.{4}\\x00\\x00",
+                rb"\xe9\x1f\x02\x00\x00\xc7\x45\xfc\x0c\x00\x00\x00\x66\xc7\x05(.{4})\x00\x00\x66\xc7\x05.{4}\x00\x00",
                 "Alien Abductor mouse X buffer",
+                code_ranges,
             )
             var_mouse_unbounded_y_mod = find_variable(
                 page_data,
-                "\\xe9\\x1f\\x02\\x00\\x00\\xc7\\x45\\xfc\\x0c\\x00\\x00\\x00\\x66\\xc7\\x05.{4}\\x00\\x00\\x66\\xc7\\x05(.{4})\\x00\\x00",
+                rb"\xe9\x1f\x02\x00\x00\xc7\x45\xfc\x0c\x00\x00\x00\x66\xc7\x05.{4}\x00\x00\x66\xc7\x05(.{4})\x00\x00",
                 "Alien Abductor mouse Y buffer",
+                code_ranges,
             )
 
         """
@@ -324,9 +445,10 @@ ret
 """
         mouselook_offset = find_offset(
             page_data,
-            "\\x8b\\xc2\\x33\\xed\\x03\\x05.{4}\\x8b\\xd8",
+            rb"\x8b\xc2\x33\xed\x03\x05.{4}\x8b\xd8",
             0,
             "mouselook mod point",
+            code_ranges,
         )
         label_check2 = create_label()
         label_after = create_label()
@@ -459,15 +581,17 @@ jmp wasd_rejoin
 """
         wasd_offset = find_offset(
             page_data,
-            "\\x80\\x3d.{4}\\x00\\x0f\\x84\\x93\\x00\\x00\\x00\\x33\\xc0",
+            rb"\x80\x3d.{4}\x00\x0f\x84\x93\x00\x00\x00\x33\xc0",
             0,
             "WASD mod point",
+            code_ranges,
         )
         wasd_rejoin = find_offset(
             page_data,
-            "\\x0f\\xb6\\x1d.{4}\\x80\\xa3.{4}\\x01" * 7,
+            rb"(?:\x0f\xb6\x1d.{4}\x80\xa3.{4}\x01){7}",
             0,
             "WASD rejoin mod point",
+            code_ranges,
         )
         label_up = create_label()
         label_down = create_label()
@@ -585,20 +709,13 @@ jmp wasd_rejoin
             ]
         )
 
-        # calculate relative jump to next bit of code
-        wasd_instrs += assemble_x86(
-            [
-                Instruction.create_branch(
-                    Code.JMP_REL32_32,
-                    wasd_rejoin - (wasd_offset + len(wasd_instrs)) - 5,
-                ),
-            ]
+        # calculate relative jump to next bit of code, add a JMP_REL32_32
+        wasd_instrs += b"\xe9" + _I32.pack(
+            wasd_rejoin - (wasd_offset + len(wasd_instrs) + 5)
         )
         wasd_mod_end = len(wasd_instrs) + wasd_offset
         # fill gap with nops
-        wasd_instrs += assemble_x86(
-            [Instruction.create(Code.NOPD)] * (wasd_rejoin - wasd_mod_end)
-        )
+        wasd_instrs += NOP_BYTES * (wasd_rejoin - wasd_mod_end)
         CODE_PATCHES.append((wasd_instrs, wasd_offset))
 
         """
@@ -606,11 +723,12 @@ The game normally maps "run" to the R key, but we're using it now, so nop out th
 """
         rkey_mod_offset = find_offset(
             page_data,
-            "\\x0f\\xb6\\x1d.{4}\\xf6\\x83.{4}\\x01\\x75\\x0c\\x66\\xb9\\x02\\x00\\x2a\\x0d.{4}\\xd3\\xf8",
+            rb"\x0f\xb6\x1d.{4}\xf6\x83.{4}\x01\x75\x0c\x66\xb9\x02\x00\x2a\x0d.{4}\xd3\xf8",
             0,
             "R key mod point",
+            code_ranges,
         )
-        rkey_mod_code = assemble_x86([Instruction.create(Code.NOPD)] * 28)
+        rkey_mod_code = NOP_BYTES * 28
         CODE_PATCHES.append((rkey_mod_code, rkey_mod_offset))
 
         """
@@ -637,22 +755,21 @@ test keyboard_state[0x13],3
 jz restore
 
 tippytoes:
-mov eax,movement_eye_level_incr
-add movement_eye_level,eax
 mov eax,movement_eye_level
+add eax,movement_eye_level_incr
 cmp eax,movement_eye_level_max
-jle fin
+jle store
 mov eax, movement_eye_level_max
-mov movement_eye_level,eax
-jmp fin
+jmp store
 
 crouch:
-mov eax,movement_eye_level_incr
-sub movement_eye_level,eax
 mov eax,movement_eye_level
+sub eax,movement_eye_level_incr
 cmp eax,movement_eye_level_min
-jge fin
+jge store
 mov eax, movement_eye_level_min
+
+store:
 mov movement_eye_level,eax
 jmp fin
 
@@ -667,10 +784,10 @@ sub eax, edx
 cmp eax,movement_eye_level_incr
 jle skip
 
-; if eye level > neutral, incr is negative, else positive
+; if eye level < neutral (edx is all ones from the cdq), incr is positive, else negative
 mov eax,movement_eye_level_incr
-cmp ecx,movement_eye_level
-jg adjust
+test edx,edx
+jnz adjust
 neg eax
 
 ; eye level += incr
@@ -691,14 +808,16 @@ ret
 """
         crouch_mod_offset = find_offset(
             page_data,
-            "\\x0f\\xb6\\x05.{4}\\x0f\\xb6\\x1d.{4}\\xf6\\x80.{4}\\x03",
+            rb"\x0f\xb6\x05.{4}\x0f\xb6\x1d.{4}\xf6\x80.{4}\x03",
             0,
             "crouch mod point",
+            code_ranges,
         )
 
         label_start = create_label()
         label_tippytoes = create_label()
         label_crouch = create_label()
+        label_store = create_label()
         label_restore = create_label()
         label_adjust = create_label()
         label_skip = create_label()
@@ -742,53 +861,49 @@ ret
                     Instruction.create_reg_mem(
                         Code.MOV_EAX_MOFFS32,
                         Register.EAX,
-                        memory(var_movement_eye_level_incr),
+                        memory(var_movement_eye_level),
                     ),
                 ),
-                Instruction.create_mem_reg(
-                    Code.ADD_RM32_R32, memory(var_movement_eye_level), Register.EAX
-                ),
                 Instruction.create_reg_mem(
-                    Code.MOV_EAX_MOFFS32, Register.EAX, memory(var_movement_eye_level)
+                    Code.ADD_R32_RM32, Register.EAX, memory(var_movement_eye_level_incr)
                 ),
                 Instruction.create_reg_mem(
                     Code.CMP_R32_RM32, Register.EAX, memory(var_movement_eye_level_max)
                 ),
-                Instruction.create_branch(Code.JLE_REL8_32, label_fin),
+                Instruction.create_branch(Code.JLE_REL8_32, label_store),
                 Instruction.create_reg_mem(
                     Code.MOV_EAX_MOFFS32,
                     Register.EAX,
                     memory(var_movement_eye_level_max),
                 ),
-                Instruction.create_mem_reg(
-                    Code.MOV_MOFFS32_EAX, memory(var_movement_eye_level), Register.EAX
-                ),
-                Instruction.create_branch(Code.JMP_REL8_32, label_fin),
+                Instruction.create_branch(Code.JMP_REL8_32, label_store),
                 add_label(
                     label_crouch,
                     Instruction.create_reg_mem(
                         Code.MOV_EAX_MOFFS32,
                         Register.EAX,
-                        memory(var_movement_eye_level_incr),
+                        memory(var_movement_eye_level),
                     ),
                 ),
-                Instruction.create_mem_reg(
-                    Code.SUB_RM32_R32, memory(var_movement_eye_level), Register.EAX
-                ),
                 Instruction.create_reg_mem(
-                    Code.MOV_EAX_MOFFS32, Register.EAX, memory(var_movement_eye_level)
+                    Code.SUB_R32_RM32, Register.EAX, memory(var_movement_eye_level_incr)
                 ),
                 Instruction.create_reg_mem(
                     Code.CMP_R32_RM32, Register.EAX, memory(var_movement_eye_level_min)
                 ),
-                Instruction.create_branch(Code.JGE_REL8_32, label_fin),
+                Instruction.create_branch(Code.JGE_REL8_32, label_store),
                 Instruction.create_reg_mem(
                     Code.MOV_EAX_MOFFS32,
                     Register.EAX,
                     memory(var_movement_eye_level_min),
                 ),
-                Instruction.create_mem_reg(
-                    Code.MOV_MOFFS32_EAX, memory(var_movement_eye_level), Register.EAX
+                add_label(
+                    label_store,
+                    Instruction.create_mem_reg(
+                        Code.MOV_MOFFS32_EAX,
+                        memory(var_movement_eye_level),
+                        Register.EAX,
+                    ),
                 ),
                 Instruction.create_branch(Code.JMP_REL8_32, label_fin),
                 add_label(
@@ -818,10 +933,10 @@ ret
                     Register.EAX,
                     memory(var_movement_eye_level_incr),
                 ),
-                Instruction.create_reg_mem(
-                    Code.CMP_R32_RM32, Register.ECX, memory(var_movement_eye_level)
+                Instruction.create_reg_reg(
+                    Code.TEST_RM32_R32, Register.EDX, Register.EDX
                 ),
-                Instruction.create_branch(Code.JG_REL8_32, label_adjust),
+                Instruction.create_branch(Code.JNE_REL8_32, label_adjust),
                 Instruction.create_reg(Code.NEG_RM32, Register.EAX),
                 add_label(
                     label_adjust,
@@ -889,35 +1004,42 @@ pop eax
         interactive_draw_frame_offset = 0
         if name == "Under a Killing Moon":
             interactive_draw_frame_offset = find_offset(
-                page_data, "\\x3a\\x05.{4}\\x74\\x22", 0, "interactive frame draw code"
+                page_data,
+                rb"\x3a\x05.{4}\x74\x22",
+                0,
+                "interactive frame draw code",
+                code_ranges,
             )
             call1_offset = find_offset(
-                page_data, "\\xe8.{4}\\x9c\\x0f\\xb6\\xc0", 0, "frame call 1"
-            )
-            call1_instrs = b"\xe8" + utils.to_int32_le(
-                vsync_offset - (call1_offset + 5)
+                page_data, rb"\xe8.{4}\x9c\x0f\xb6\xc0", 0, "frame call 1", code_ranges
             )
+            call1_instrs = b"\xe8" + _I32.pack(vsync_offset - (call1_offset + 5))
             CODE_PATCHES.append((call1_instrs, call1_offset))
         elif name == "The Pandora Directive":
             interactive_draw_frame_offset = find_offset(
                 page_data,
-                "\\x06\\x60\\x66\\xc7\\x05.{4}\\x00\\x00\\xa8\\x01",
+                rb"\x06\x60\x66\xc7\x05.{4}\x00\x00\xa8\x01",
                 0,
                 "interactive frame draw code",
+                code_ranges,
             )
             call1_offset = find_offset(
-                page_data, "\\xe8.{4}\\x89\\x45\\xf8\\xb8.{4}", 0, "frame call 1"
-            )
-            call1_instrs = b"\xe8" + utils.to_int32_le(
-                vsync_offset - (call1_offset + 5)
+                page_data,
+                rb"\xe8.{4}\x89\x45\xf8\xb8.{4}",
+                0,
+                "frame call 1",
+                code_ranges,
             )
+            call1_instrs = b"\xe8" + _I32.pack(vsync_offset - (call1_offset + 5))
             CODE_PATCHES.append((call1_instrs, call1_offset))
             call2_offset = find_offset(
-                page_data, "\\xe8.{4}\\x89\\x45\\xf4\\xb8.{4}", 0, "frame call 2"
-            )
-            call2_instrs = b"\xe8" + utils.to_int32_le(
-                vsync_offset - (call2_offset + 5)
+                page_data,
+                rb"\xe8.{4}\x89\x45\xf4\xb8.{4}",
+                0,
+                "frame call 2",
+                code_ranges,
             )
+            call2_instrs = b"\xe8" + _I32.pack(vsync_offset - (call2_offset + 5))
             CODE_PATCHES.append((call2_instrs, call2_offset))
         # shim, which waits for vsync then runs the original function
         vsync_instrs = assemble_x86(
@@ -938,7 +1060,7 @@ pop eax
             ]
         )
         # add a JMP_REL32_32
-        vsync_instrs += b"\xe9" + utils.to_int32_le(
+        vsync_instrs += b"\xe9" + _I32.pack(
             interactive_draw_frame_offset - (vsync_offset + len(vsync_instrs) + 5)
         )
         CODE_PATCHES.append((vsync_instrs, vsync_offset))
@@ -1030,9 +1152,10 @@ pop eax
             """
             abductor_offset = find_offset(
                 page_data,
-                "\\x53\\x51\\x52\\x56\\x57\\x55\\x89\\xe5\\x81\\xec\\x0c\\x00\\x00\\x00\\xeb\\x10",
+                rb"\x53\x51\x52\x56\x57\x55\x89\xe5\x81\xec\x0c\x00\x00\x00\xeb\x10",
                 0,
                 "Alien Abductor control buttons",
+                code_ranges,
             )
             label_hoverup_write = create_label()
             label_hoverdown = create_label()
@@ -1215,46 +1338,28 @@ So here we nop out the injection part.
 
             abductor_hoverup_offset = find_offset(
                 page_data,
-                "\\x80\\x88.{4}\\x02\\xc6\\x05.{4}\\x00\\xc6\\x05.{4}\\x00\\x31\\xc0\\xe8.{4}\\x80\\x3d.{4}\\x00\\x74\\x1e\\xe8.{4}\\xba\\x01\\x00\\x00\\x00\\xb8\\x04\\x00\\x00\\x00",
+                rb"\x80\x88.{4}\x02\xc6\x05.{4}\x00\xc6\x05.{4}\x00\x31\xc0\xe8.{4}\x80\x3d.{4}\x00\x74\x1e\xe8.{4}\xba\x01\x00\x00\x00\xb8\x04\x00\x00\x00",
                 0,
                 "Alien Abductor hover-up button",
+                code_ranges,
             )
-            abductor_hoverup_instrs = assemble_x86(
-                [
-                    Instruction.create(Code.NOPD),
-                    Instruction.create(Code.NOPD),
-                    Instruction.create(Code.NOPD),
-                    Instruction.create(Code.NOPD),
-                    Instruction.create(Code.NOPD),
-                    Instruction.create(Code.NOPD),
-                    Instruction.create(Code.NOPD),
-                ]
-            )
+            abductor_hoverup_instrs = NOP_BYTES * 7
             CODE_PATCHES.append((abductor_hoverup_instrs, abductor_hoverup_offset))
 
             abductor_hoverdown_offset = find_offset(
                 page_data,
-                "\\x80\\x88.{4}\\x02\\xc6\\x05.{4}\\x00\\xc6\\x05.{4}\\x00\\x31\\xc0\\xe8.{4}\\x80\\x3d.{4}\\x00\\x74\\x1e\\xe8.{4}\\xba\\x01\\x00\\x00\\x00\\xb8\\x05\\x00\\x00\\x00",
+                rb"\x80\x88.{4}\x02\xc6\x05.{4}\x00\xc6\x05.{4}\x00\x31\xc0\xe8.{4}\x80\x3d.{4}\x00\x74\x1e\xe8.{4}\xba\x01\x00\x00\x00\xb8\x05\x00\x00\x00",
                 0,
                 "Alien Abductor hover-down button",
+                code_ranges,
             )
-            abductor_hoverdown_instrs = assemble_x86(
-                [
-                    Instruction.create(Code.NOPD),
-                    Instruction.create(Code.NOPD),
-                    Instruction.create(Code.NOPD),
-                    Instruction.create(Code.NOPD),
-                    Instruction.create(Code.NOPD),
-                    Instruction.create(Code.NOPD),
-                    Instruction.create(Code.NOPD),
-                ]
-            )
+            abductor_hoverdown_instrs = NOP_BYTES * 7
             CODE_PATCHES.append((abductor_hoverdown_instrs, abductor_hoverdown_offset))
 
     if name == "Under a Killing Moon":
         try:
             credit_offset = find_offset(
-                page_data, "and developed by", 0, "opening credits"
+                page_data, b"and developed by", 0, "opening credits"
             )
             credit_data = b"(c) 1993.        \rMouselook v1.2 (c) 2025 moralrecordings.    \r                                "
             DATA_PATCHES.append((credit_data, credit_offset))
@@ -1262,133 +1367,95 @@ So here we nop out the injection part.
             pass
 
     # Apply the code patches, change the fixup table to match
-    CODE_OBJ = 0
-    DATA_OBJ = 2
+    # decode into the same Instruction every time, rather than allocating one each
+    instr = Instruction()
     for mod_code, mod_offset in CODE_PATCHES:
-        # print("Fixups to remove:")
-        PATCH_RANGE = (mod_offset, mod_offset + len(mod_code))
-        for i in range(len(fixup_records)):
-            page_offset = i * le_header.page_size
-            if (
-                page_offset >= PATCH_RANGE[1]
-                or (page_offset + le_header.page_size) < PATCH_RANGE[0]
-            ):
-                continue
-            to_remove = []
-            for j, record in enumerate(fixup_records[i]):
-                src_addr = record.srcoff + page_offset
-                if src_addr in range(PATCH_RANGE[0], PATCH_RANGE[1]):
-                    # print((i, j, hex(src_addr), record))
-                    to_remove.append(j)
-            to_remove.reverse()
-            for j in to_remove:
-                fixup_records[i].pop(j)
-        # print("Fixups to add:")
+        patch_start, patch_end = mod_offset, mod_offset + len(mod_code)
+        # only visit the pages the patch actually lands on
+        first_page = patch_start >> page_shift
+        last_page = (patch_end - 1) >> page_shift
+        for i in range(first_page, min(last_page + 1, len(fixup_record_table))):
+            page_offset = i << page_shift
+            records = fixup_records.get(i)
+            if records is None:
+                records = fixups_decode(fixup_record_table[i])
+            # rebuild the page's fixup list in one pass, rather than popping records
+            lo, hi = patch_start - page_offset, patch_end - page_offset
+            fixup_records[i] = [
+                record for record in records if not lo <= record.srcoff < hi
+            ]
         decoder = Decoder(32, mod_code)
-        for instr in decoder:
-            # print((instr, instr.code))
-            offset = mod_offset + instr.ip
+        while decoder.can_decode:
+            decoder.decode_out(instr)
             code = instr.code
-            srcoff = offset % le_header.page_size
-            page = offset // le_header.page_size
-            # this is incomplete, there's hundreds of instructions in x86 which access memory.
-            # I'm just adding them when I need them
-            match code:
-                case (
-                    Code.ADD_RM32_R32
-                    | Code.MOV_RM32_IMM32
-                    | Code.AND_R8_RM8
-                    | Code.TEST_RM8_IMM8
-                    | Code.CMP_R32_RM32
-                    | Code.CMP_RM8_IMM8
-                    | Code.MOV_R8_RM8
-                    | Code.MOV_R32_RM32
-                    | Code.ADD_R32_RM32
-                    | Code.AND_RM8_IMM8
-                ):
-                    fixup = FixupTuple(
-                        "fix_32off_32",
-                        0x7,
-                        0x10,
-                        DATA_OBJ,
-                        srcoff + 2,
-                        utils.from_uint32_le(mod_code[instr.ip + 2 : instr.ip + 6]),
-                    )
-                    # print((page, None, hex(offset), fixup))
-                    fixup_records[page].append(fixup)
-                case Code.MOV_RM32_R32 | Code.SUB_RM32_R32:
-                    # this bastard can have both memory and registers as a source operand
-                    if instr.memory_displacement:
-                        fixup = FixupTuple(
-                            "fix_32off_32",
-                            0x7,
-                            0x10,
-                            DATA_OBJ,
-                            srcoff + 2,
-                            utils.from_uint32_le(mod_code[instr.ip + 2 : instr.ip + 6]),
-                        )
-                        # print((page, None, hex(offset), fixup))
-                        fixup_records[page].append(fixup)
-                case Code.MOV_AL_MOFFS8 | Code.MOV_MOFFS32_EAX | Code.MOV_EAX_MOFFS32:
-                    fixup = FixupTuple(
-                        "fix_32off_32",
-                        0x7,
-                        0x10,
-                        DATA_OBJ,
-                        srcoff + 1,
-                        utils.from_uint32_le(mod_code[instr.ip + 1 : instr.ip + 5]),
-                    )
-                    # print((page, None, hex(offset), fixup))
-                    fixup_records[page].append(fixup)
-                case Code.MOV_RM16_IMM16:
-                    fixup = FixupTuple(
-                        "fix_32off_32",
-                        0x7,
-                        0x10,
-                        DATA_OBJ,
-                        srcoff + 3,
-                        utils.from_uint32_le(mod_code[instr.ip + 3 : instr.ip + 7]),
-                    )
-                    # print((page, None, hex(offset), fixup))
-                    fixup_records[page].append(fixup)
-                case Code.JMP_RM32:
-                    fixup = FixupTuple(
-                        "fix_32off_32",
-                        0x7,
-                        0x10,
-                        CODE_OBJ,
-                        srcoff + 3,
-                        utils.from_uint32_le(mod_code[instr.ip + 3 : instr.ip + 7]),
-                    )
-                    # print((page, None, hex(offset), fixup))
-                    fixup_records[page].append(fixup)
-
-        page_data[mod_offset : mod_offset + len(mod_code)] = mod_code
-
-    for mod_data, mod_offset in DATA_PATCHES:
-        page_data[mod_offset : mod_offset + len(mod_data)] = mod_data
+            target_obj = FIXUP_INSTRUCTIONS.get(code)
+            if target_obj is None:
+                continue
+            # these bastards can have both memory and registers as a source operand
+            if code in MEMORY_OR_REGISTER and not instr.memory_displacement:
+                continue
+            offset = mod_offset + instr.ip
+            srcoff = offset & page_mask
+            page = offset >> page_shift
+            disp_offset = decoder.get_constant_offsets(instr).displacement_offset
+            fixup = FixupTuple(
+                "fix_32off_32",
+                0x7,
+                0x10,
+                target_obj,
+                srcoff + disp_offset,
+                instr.memory_displacement,
+            )
+            logger.debug("Adding fixup on page %d at 0x%08x: %s", page, offset, fixup)
+            fixup_records[page].append(fixup)
+
+    # Only copy the stretches of page data covered by the patches; the rest of
+    # the section is written out untouched. Overlapping or adjacent patches share
+    # a stretch, and are applied in order, as some (e.g. the vsync shim)
+    # overwrite others.
+    all_patches = CODE_PATCHES + DATA_PATCHES
+    spans: list[list[int]] = []
+    for start, end in sorted(
+        (mod_offset, mod_offset + len(mod_data)) for mod_data, mod_offset in all_patches
+    ):
+        if spans and start <= spans[-1][1]:
+            spans[-1][1] = max(spans[-1][1], end)
+        else:
+            spans.append([start, end])
+    span_starts = [start for start, _ in spans]
+    patched_spans = [bytearray(page_data[start:end]) for start, end in spans]
+    for mod_data, mod_offset in all_patches:
+        i = bisect_right(span_starts, mod_offset) - 1
+        start = mod_offset - span_starts[i]
+        patched_spans[i][start : start + len(mod_data)] = mod_data
+
+    page_data_output: list[memoryview | bytearray] = []
+    last_end = 0
+    for (start, end), patched_span in zip(spans, patched_spans):
+        page_data_output += (page_data[last_end:start], patched_span)
+        last_end = end
+    page_data_output.append(page_data[last_end:])
 
     # Finally, write the output file with our changes
     with open(output, "wb") as out:
-        fixup_output = [fixups_encode(x) for x in fixup_records]
-        fixup_page_table.offsets = []
-        acc = 0
-        for x in fixup_output:
-            fixup_page_table.offsets.append(acc)
-            acc += len(x)
-        fixup_page_table.offsets.append(acc)
+        fixup_output = [
+            fixups_encode(fixup_records[i]) if i in fixup_records else raw
+            for i, raw in enumerate(fixup_record_table)
+        ]
+        fixup_page_table.offsets = list(
+            accumulate((len(x) for x in fixup_output), initial=0)
+        )
         fixup_page_table_output = fixup_page_table.export_data()
-        fixup_record_table_output = b"".join(fixup_output)
 
         post_fixup_start = le_header.import_module_table_offset
         post_fixup_end = mz_off + le_header.data_pages_offset - le_off
-        post_fixup_blob = f[le_off + post_fixup_start : le_off + post_fixup_end]
+        post_fixup_blob = fv[le_off + post_fixup_start : le_off + post_fixup_end]
 
         le_header.fixup_record_table_offset = le_header.fixup_page_table_offset + len(
             fixup_page_table_output
         )
-        le_header.fixup_section_size = len(fixup_page_table_output) + len(
-            fixup_record_table_output
+        le_header.fixup_section_size = (
+            len(fixup_page_table_output) + fixup_page_table.offsets[-1]
         )
         le_header.fixup_section_csum = 0
 
@@ -1403,13 +1470,19 @@ So here we nop out the injection part.
             - mz_off
         )
 
-        out.write(f[:le_off])
-        out.write(le_header.export_data())
+        # gather everything and hand it over in one go; the per-page fixup records
+        # go out as-is, rather than being joined into another copy first
         header_size = le_header.get_size()
-        out.write(f[le_off + header_size : le_off + le_header.fixup_page_table_offset])
-        out.write(fixup_page_table_output)
-        out.write(fixup_record_table_output)
-        out.write(post_fixup_blob)
-        out.write(page_data)
+        out.writelines(
+            [
+                fv[:le_off],
+                le_header.export_data(),
+                fv[le_off + header_size : le_off + le_header.fixup_page_table_offset],
+                fixup_page_table_output,
+                *fixup_output,
+                post_fixup_blob,
+                *page_data_output,
+            ]
+        )
 
     print(f"Finished patching {name} v{version}, {language.title()} language")